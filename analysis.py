@@ -0,0 +1,232 @@
+#!/usr/bin/python
+
+import os
+import sys
+import csv
+import argparse
+import warnings
+import numpy as np
+
+from utils import *
+
+# Batch analysis of recorded angle data. Every recording is loaded as one
+# array and all calculations run on whole columns at once, so thousands of
+# recordings can be checked in one go.
+
+# Columns every recording starts with, see the recorder
+COLUMNS = ['Time', 'Width', 'Height', 'Base X', 'Base Y', 'Pos X', 'Pos Y', 'Diameter', 'Angle_X', 'Angle_Y']
+TIME, WIDTH, HEIGHT, BASE_X, BASE_Y, POS_X, POS_Y, DIAMETER, ANGLE_X, ANGLE_Y = range(len(COLUMNS))
+
+# Input range of the angles as mapped by the player
+MIN_INPUT = -90
+MAX_INPUT = 90
+
+
+# ===========================================================================//
+# -----------------------------------------------------------// Argument Parser
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Batch analysis of recorded angle data.')
+    parser.add_argument('recordings', nargs='*', help='CSV files or session directories (default: csv-files from the player config and all sessions).')
+    parser.add_argument('-c', '--config', help='Path to the config file.', default='config.yaml')
+    parser.add_argument('-p', '--player-config', help='Path to the player config file.', default='player_config.yaml')
+    parser.add_argument('--diameter-bounds', help='Alternative diameter calibration, two values.', type=float, nargs=2, default=None)
+    parser.add_argument('--angle-bounds', help='Alternative angle calibration, two values.', type=float, nargs=2, default=None)
+    parser.add_argument('--interpolation', help='Interpolation used to recompute Angle_Y.', choices=['linear', 'log', 'exp'], default='log')
+    parser.add_argument('--outlier-threshold', help='Robust z-score above which a velocity counts as an outlier.', type=float, default=6.0)
+    parser.add_argument('--dropout-factor', help='A gap longer than this many median sample intervals counts as a dropout.', type=float, default=3.0)
+    parser.add_argument('-o', '--output', help='Write the summary to a CSV file.', default=None)
+    return parser.parse_args()
+
+
+# ===========================================================================//
+# ---------------------------------------------------------------------// Loading
+
+# -----------------------------------------/
+# ---/ Resolve a session directory to its angle file
+def recording_path(path):
+    if os.path.isdir(path):
+        return os.path.join(path, 'angles.csv')
+    return path
+
+# -----------------------------------------/
+# ---/ Load a recording as a float array, one row per sample
+def load_recording(path):
+    with warnings.catch_warnings():
+        # An empty recording only has its header
+        warnings.simplefilter('ignore', UserWarning)
+        data = np.loadtxt(recording_path(path), delimiter=',', skiprows=1, ndmin=2)
+    if data.size == 0:
+        return np.zeros((0, len(COLUMNS)))
+    return data
+
+# -----------------------------------------/
+# ---/ Default set of recordings: the player's csv-files and all sessions
+def default_recordings(player_config, sessions_directory):
+    paths = [path for path in player_config.get('csv-files', []) if os.path.exists(path)]
+    if os.path.isdir(sessions_directory):
+        for name in sorted(os.listdir(sessions_directory)):
+            path = os.path.join(sessions_directory, name)
+            if os.path.exists(os.path.join(path, 'angles.csv')):
+                paths.append(path)
+    return paths
+
+
+# ===========================================================================//
+# ----------------------------------------------------------------// Calculation
+
+# -----------------------------------------/
+# ---/ Vectorised calculate_angle for arrays of base and ball positions
+def calculate_angles(base_x, base_y, pos_x, pos_y):
+    # Negate dy to adjust for screen coordinate system
+    angle = np.degrees(np.arctan2(-(pos_y - base_y), pos_x - base_x))
+    # Same clamping as calculate_angle
+    return np.where(angle < -90, -90.0, np.where(angle < 0, 90.0, -(angle - 90)))
+
+# -----------------------------------------/
+# ---/ Fit a diameter to Angle_Y calibration once, returns (interpolation function, params)
+def calculate_calibration(diameter_bounds, angle_bounds, interpolation='log'):
+    input_range = np.array(diameter_bounds, dtype=np.float64)
+    output_range = np.array(angle_bounds, dtype=np.float64)
+    if interpolation == 'linear':
+        return linear_interpolation, calculate_linear_params(input_range, output_range)
+    if interpolation == 'exp':
+        return exponential_interpolation, calculate_exp_params(input_range, output_range)
+    return logarithmic_interpolation, calculate_log_params(input_range, output_range)
+
+# -----------------------------------------/
+# ---/ Recompute Angle_Y from the diameter with a calibration
+def calculate_angles_y(diameter, calibration):
+    interpolate, params = calibration
+    # Held samples before the first detection have a diameter of 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        angles = interpolate(diameter, params)
+    return np.where(diameter > 0, angles, np.nan)
+
+# -----------------------------------------/
+# ---/ Velocity and acceleration of a column over time (per second)
+def derivatives(values, times):
+    if len(values) < 2:
+        zeros = np.zeros_like(values)
+        return zeros, zeros
+    # Repeated timestamps give infinite rates, they are left out as NaN
+    with np.errstate(divide='ignore', invalid='ignore'):
+        velocity = np.gradient(values, times)
+        acceleration = np.gradient(velocity, times)
+    velocity[~np.isfinite(velocity)] = np.nan
+    acceleration[~np.isfinite(acceleration)] = np.nan
+    return velocity, acceleration
+
+# -----------------------------------------/
+# ---/ Map angles to servo outputs like the player and flag clamped samples
+def servo_range(angles, limits):
+    low, high = limits
+    output = low + (angles - MIN_INPUT) * (high - low) / (MAX_INPUT - MIN_INPUT)
+    return (output < low) | (output > high)
+
+# -----------------------------------------/
+# ---/ Robust z-score outliers (median / MAD)
+def outliers(values, threshold):
+    values = values[np.isfinite(values)]
+    if len(values) == 0:
+        return 0
+    median = np.median(values)
+    mad = np.median(np.abs(values - median))
+    if mad == 0:
+        return 0
+    score = 0.6745 * np.abs(values - median) / mad
+    return int(np.count_nonzero(score > threshold))
+
+# -----------------------------------------/
+# ---/ Time gaps longer than a multiple of the median interval
+def dropouts(times, factor):
+    if len(times) < 3:
+        return 0, 0.0
+    intervals = np.diff(times)
+    gaps = intervals[intervals > factor * np.median(intervals)]
+    return len(gaps), float(gaps.sum())
+
+# -----------------------------------------/
+# ---/ Analyse one recording, returns a summary dict
+def analyse_recording(data, calibration, x_limits, y_limits, outlier_threshold=6.0, dropout_factor=3.0):
+    times = data[:, TIME]
+    summary = {'samples': len(data), 'duration': float(times[-1] - times[0]) if len(data) else 0.0}
+    if len(data) == 0:
+        return summary
+
+    # Held samples before the first detection have Pos 0,0 and a diameter of 0,
+    # they are left out of every angle and motion value
+    detected = data[:, DIAMETER] > 0
+    summary['detected-samples'] = int(np.count_nonzero(detected))
+    summary['dropouts'], summary['dropout-time'] = dropouts(times, dropout_factor)
+    # The tracker holds the last detection when the ball is lost, so repeated
+    # positions are samples without a detection
+    held = (np.diff(data[:, POS_X]) == 0) & (np.diff(data[:, POS_Y]) == 0) & (np.diff(data[:, DIAMETER]) == 0)
+    summary['held-samples'] = int(np.count_nonzero(held))
+    if not detected.any():
+        return summary
+    rows = data[detected]
+    detected_times = rows[:, TIME]
+
+    # Recompute the angles from the raw positions
+    angle_x = calculate_angles(rows[:, BASE_X], rows[:, BASE_Y], rows[:, POS_X], rows[:, POS_Y])
+    angle_y = calculate_angles_y(rows[:, DIAMETER], calibration)
+    summary['angle-x-max-diff'] = float(np.max(np.abs(angle_x - rows[:, ANGLE_X])))
+    summary['angle-y-max-diff'] = float(np.max(np.abs(angle_y - rows[:, ANGLE_Y])))
+
+    # Motion profiles of the recomputed angles
+    velocity_x, acceleration_x = derivatives(angle_x, detected_times)
+    velocity_y, acceleration_y = derivatives(angle_y, detected_times)
+    summary['velocity-x-max'] = float(np.nanmax(np.abs(velocity_x), initial=0.0))
+    summary['velocity-y-max'] = float(np.nanmax(np.abs(velocity_y), initial=0.0))
+    summary['acceleration-x-max'] = float(np.nanmax(np.abs(acceleration_x), initial=0.0))
+    summary['acceleration-y-max'] = float(np.nanmax(np.abs(acceleration_y), initial=0.0))
+
+    # Range of motion against the servo limits
+    summary['angle-x-range'] = float(angle_x.max() - angle_x.min())
+    summary['angle-y-range'] = float(angle_y.max() - angle_y.min())
+    summary['x-clamped'] = int(np.count_nonzero(servo_range(angle_x, x_limits)))
+    summary['y-clamped'] = int(np.count_nonzero(servo_range(angle_y, y_limits)))
+
+    # Outliers
+    summary['outliers'] = outliers(velocity_x, outlier_threshold) + outliers(velocity_y, outlier_threshold)
+    return summary
+
+
+# ===========================================================================//
+# --------------------------------------------------------// Main program logic
+
+if __name__ == '__main__':
+
+    args = parse_arguments()
+    config = read_config(args.config)
+    player_config = read_config(args.player_config)
+
+    diameter_bounds = args.diameter_bounds or config['diameter-bounds']
+    angle_bounds = args.angle_bounds or config['angle-bounds']
+    calibration = calculate_calibration(diameter_bounds, angle_bounds, args.interpolation)
+    x_limits = player_config['x-values']
+    y_limits = player_config['y-values']
+
+    paths = args.recordings or default_recordings(player_config, config.get('sessions-directory', 'sessions'))
+    if not paths:
+        print('No recordings found')
+        sys.exit(1)
+
+    summaries = []
+    for path in paths:
+        summary = analyse_recording(load_recording(path), calibration, x_limits, y_limits,
+                                    args.outlier_threshold, args.dropout_factor)
+        summary = {'recording': path, **summary}
+        summaries.append(summary)
+        print(', '.join(f"{key}: {value:.2f}" if isinstance(value, float) else f"{key}: {value}" for key, value in summary.items()))
+
+    if args.output:
+        keys = []
+        for summary in summaries:
+            keys += [key for key in summary if key not in keys]
+        with open(args.output, 'w', newline='') as file:
+            writer = csv.DictWriter(file, fieldnames=keys)
+            writer.writeheader()
+            writer.writerows(summaries)
+        print(f"Summary written to {args.output}")
@@ -0,0 +1,156 @@
+import time
+from collections import deque
+from threading import Thread, Lock
+import cv2
+
+# ===========================================================================//
+# -------------------------------------------------------------// Camera Capture
+
+# Threaded capture for one or more cameras. Every camera is grabbed on its own
+# thread into a short buffer of timestamped frames, so a slow camera never
+# holds up the others and frames from different cameras can be matched by
+# time instead of by arrival.
+
+# -----------------------------------------/
+# ---/ Single camera grabbed on a dedicated thread
+class CameraStream:
+
+    def __init__(self, src, buffer_size=4):
+        self.src = src
+        self.stream = cv2.VideoCapture(src)
+        if not self.stream.isOpened():
+            raise IOError(f"Could not open video source {src}")
+        self.fps = self.stream.get(cv2.CAP_PROP_FPS) or 30
+
+        self.frames = deque(maxlen=buffer_size)  # (timestamp, index, frame)
+        self.lock = Lock()
+        self.index = 0
+        self.dropped = 0
+        self.last_read_index = -1
+        self.running = False
+        self.thread = None
+
+    # -----------------------------------------/
+    # ---/ Start the capture thread
+    def start(self):
+        self.running = True
+        self.thread = Thread(target=self.update, daemon=True)
+        self.thread.start()
+        return self
+
+    # -----------------------------------------/
+    # ---/ Timestamp of the frame that was just grabbed
+    def grab_timestamp(self):
+        now = time.monotonic()
+        # V4L2 and AVFoundation report the driver timestamp of the buffer in
+        # CAP_PROP_POS_MSEC. On Linux it is on the monotonic clock, so it is only
+        # used when it is plausibly on the same clock as time.monotonic()
+        hardware = self.stream.get(cv2.CAP_PROP_POS_MSEC) / 1000
+        if 0 < now - hardware < 1.0:
+            return hardware
+        return now
+
+    # -----------------------------------------/
+    # ---/ Capture loop
+    def update(self):
+        while self.running:
+            ret, frame = self.stream.read()
+            if not ret:
+                time.sleep(0.005)
+                continue
+            timestamp = self.grab_timestamp()
+            with self.lock:
+                self.frames.append((timestamp, self.index, frame))
+                self.index += 1
+
+    # -----------------------------------------/
+    # ---/ Latest frame as (timestamp, index, frame), or None before the first frame
+    def latest(self):
+        with self.lock:
+            if not self.frames:
+                return None
+            return self.frames[-1]
+
+    # -----------------------------------------/
+    # ---/ Buffered frame closest to a timestamp
+    def closest(self, timestamp):
+        with self.lock:
+            if not self.frames:
+                return None
+            return min(self.frames, key=lambda f: abs(f[0] - timestamp))
+
+    # -----------------------------------------/
+    # ---/ Number of buffered frames that have not been read yet
+    def pending(self):
+        with self.lock:
+            return sum(1 for f in self.frames if f[1] > self.last_read_index)
+
+    # -----------------------------------------/
+    # ---/ Mark a frame as read
+    # Frames grabbed between two reads were never processed and count as dropped
+    def mark_read(self, index):
+        with self.lock:
+            if self.last_read_index >= 0 and index > self.last_read_index + 1:
+                self.dropped += index - self.last_read_index - 1
+            self.last_read_index = max(self.last_read_index, index)
+
+    # -----------------------------------------/
+    # ---/ Stop the thread and release the camera
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(timeout=1.0)
+        self.stream.release()
+
+
+# -----------------------------------------/
+# ---/ Group of cameras returning time-aligned frames
+class CameraGroup:
+
+    def __init__(self, sources, buffer_size=4):
+        self.cameras = [CameraStream(src, buffer_size) for src in sources]
+        self.fps = min(camera.fps for camera in self.cameras)
+
+    def __len__(self):
+        return len(self.cameras)
+
+    # -----------------------------------------/
+    # ---/ Start all capture threads and wait for the first frame of each camera
+    def start(self, timeout=5.0):
+        for camera in self.cameras:
+            camera.start()
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if all(camera.latest() is not None for camera in self.cameras):
+                return self
+            time.sleep(0.01)
+        raise IOError("Timed out waiting for the first frame from every camera")
+
+    # -----------------------------------------/
+    # ---/ Read one aligned sample
+    # The newest frame of the first camera is the reference, every other camera
+    # contributes its buffered frame closest in time. Returns the list of
+    # (timestamp, index, frame) per camera and the skew between them in seconds.
+    def read(self):
+        reference = self.cameras[0].latest()
+        sample = [reference]
+        for camera in self.cameras[1:]:
+            sample.append(camera.closest(reference[0]))
+        for camera, (timestamp, index, frame) in zip(self.cameras, sample):
+            camera.mark_read(index)
+        timestamps = [timestamp for timestamp, index, frame in sample]
+        return sample, max(timestamps) - min(timestamps)
+
+    # -----------------------------------------/
+    # ---/ Frames dropped and waiting per camera, for the metrics
+    def dropped(self):
+        return [camera.dropped for camera in self.cameras]
+
+    def pending(self):
+        return [camera.pending() for camera in self.cameras]
+
+    # -----------------------------------------/
+    # ---/ Stop all cameras
+    def stop(self):
+        for camera in self.cameras:
+            camera.stop()
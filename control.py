@@ -0,0 +1,188 @@
+import asyncio
+import queue
+from threading import Thread
+import paho.mqtt.client as mqtt
+
+# ===========================================================================//
+# -------------------------------------------------------------// Control Plane
+
+# Event-driven control for the recorder. Network I/O runs on an asyncio loop
+# in its own thread, so a slow broker never stalls the frame loop, and every
+# command, whether it comes from the keyboard or from MQTT, goes through one
+# queue that the frame loop drains at a single point per frame. Tracker and
+# recording state are therefore only ever changed by the frame loop.
+
+# -----------------------------------------/
+# ---/ Hooks paho's socket callbacks into an asyncio loop
+class AsyncioMqttHelper:
+
+    def __init__(self, loop, client):
+        self.loop = loop
+        self.client = client
+        self.misc = None
+        client.on_socket_open = self.on_socket_open
+        client.on_socket_close = self.on_socket_close
+        client.on_socket_register_write = self.on_socket_register_write
+        client.on_socket_unregister_write = self.on_socket_unregister_write
+
+    def on_socket_open(self, client, userdata, sock):
+        self.loop.add_reader(sock, client.loop_read)
+        self.misc = self.loop.create_task(self.misc_loop())
+
+    def on_socket_close(self, client, userdata, sock):
+        self.loop.remove_reader(sock)
+        if self.misc is not None:
+            self.misc.cancel()
+            self.misc = None
+
+    def on_socket_register_write(self, client, userdata, sock):
+        self.loop.add_writer(sock, client.loop_write)
+
+    def on_socket_unregister_write(self, client, userdata, sock):
+        self.loop.remove_writer(sock)
+
+    # Keepalive pings and timeouts
+    async def misc_loop(self):
+        while self.client.loop_misc() == mqtt.MQTT_ERR_SUCCESS:
+            try:
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                break
+
+
+class ControlPlane:
+
+    # -----------------------------------------/
+    # ---/ Init
+    def __init__(self, unique_id, topic_prefix, enable_mqtt=False, broker_address=None, username=None, password=None,
+                 port=1883, keepalive=60, min_reconnect_delay=1.0, max_reconnect_delay=30.0):
+        self.unique_id = unique_id
+        self.topic_prefix = topic_prefix
+        self.enable_mqtt = enable_mqtt
+        self.broker_address = broker_address
+        self.username = username
+        self.password = password
+        self.port = port
+        self.keepalive = keepalive
+        self.min_reconnect_delay = min_reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+
+        # (source, command) tuples for the frame loop
+        self.queue = queue.SimpleQueue()
+
+        self.loop = None
+        self.thread = None
+        self.client = None
+        self.connected = False
+        self.reconnect_delay = min_reconnect_delay
+
+    # -----------------------------------------/
+    # ---/ Start the network loop thread
+    def start(self):
+        if self.enable_mqtt:
+            self.loop = asyncio.new_event_loop()
+            self.client = mqtt.Client()
+            self.client.username_pw_set(self.username, self.password)
+            self.client.on_connect = self.on_connect
+            self.client.on_disconnect = self.on_disconnect
+            self.client.on_message = self.on_message
+            AsyncioMqttHelper(self.loop, self.client)
+            self.thread = Thread(target=self.run, daemon=True)
+            self.thread.start()
+        return self
+
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.create_task(self.maintain_connection())
+        self.loop.run_forever()
+
+    # -----------------------------------------/
+    # ---/ Commands
+    def submit(self, source, command):
+        self.queue.put((source, command))
+
+    def commands(self):
+        # Drain everything that arrived since the last frame
+        while True:
+            try:
+                yield self.queue.get_nowait()
+            except queue.Empty:
+                return
+
+    def pending(self):
+        return self.queue.qsize()
+
+    # -----------------------------------------/
+    # ---/ Publish from the frame loop without blocking it
+    def publish(self, topic, payload):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.client.publish, f"{self.topic_prefix}/{topic}", payload)
+
+    # Tell the other recorders about a command
+    def broadcast(self, command):
+        if self.loop is None:
+            return
+        print(f"publishing {self.unique_id}|{command} to {self.topic_prefix}/record")
+        self.publish("record", f"{self.unique_id}|{command}")
+
+    # -----------------------------------------/
+    # ---/ MQTT connection with exponential backoff
+    async def maintain_connection(self):
+        self.disconnected = asyncio.Event()
+
+        while True:
+            self.disconnected.clear()
+            try:
+                # Only this thread waits for the broker, the frame loop keeps running
+                self.client.connect(self.broker_address, self.port, self.keepalive)
+                await self.disconnected.wait()
+            except OSError as e:
+                print(f"Could not connect to MQTT Broker: {e}")
+            print(f"Reconnecting to MQTT Broker in {self.reconnect_delay:.1f}s")
+            await asyncio.sleep(self.reconnect_delay)
+            self.reconnect_delay = min(self.reconnect_delay * 2, self.max_reconnect_delay)
+
+    # -----------------------------------------/
+    # ---/ MQTT callbacks, they run on the network loop thread
+    def on_connect(self, client, userdata, flags, rc):
+        print("Connected to MQTT Broker with result code " + str(rc))
+        if rc == 0:
+            self.connected = True
+            self.reconnect_delay = self.min_reconnect_delay
+            client.subscribe(f"{self.topic_prefix}/record")
+
+    def on_disconnect(self, client, userdata, rc):
+        print("Disconnected from MQTT Broker with result code " + str(rc))
+        self.connected = False
+        self.disconnected.set()
+
+    def on_message(self, client, userdata, msg):
+        message = msg.payload.decode()
+        if '|' not in message:
+            return
+        msg_id, command = message.split('|', 1)
+
+        # Ignore if the message is from this script
+        if msg_id == self.unique_id:
+            return
+        self.submit('mqtt', command)
+
+    # -----------------------------------------/
+    # ---/ Disconnect and stop the network loop
+    def stop(self):
+        if self.loop is None:
+            return
+
+        async def shutdown():
+            tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            if self.connected:
+                self.client.disconnect()
+                # Give the loop a moment to flush the disconnect packet
+                await asyncio.sleep(0.1)
+            self.loop.stop()
+
+        asyncio.run_coroutine_threadsafe(shutdown(), self.loop)
+        self.thread.join(timeout=2.0)
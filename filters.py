@@ -0,0 +1,89 @@
+import math
+
+# ===========================================================================//
+# -------------------------------------------------------------------// Filters
+
+# Temporal filters for the tracked position and diameter. Each filter smooths
+# a single value and is fed one sample per detection with its timestamp in
+# seconds.
+
+# -----------------------------------------/
+# ---/ Exponential moving average (the original 'moving-average-strength')
+class ExponentialFilter:
+
+    def __init__(self, strength):
+        self.strength = strength
+        self.value = None
+
+    def update(self, value, timestamp):
+        if self.value is None:
+            self.value = value
+        else:
+            self.value = self.value * (self.strength - 1) / self.strength + value / self.strength
+        return self.value
+
+    def reset(self):
+        self.value = None
+
+
+# -----------------------------------------/
+# ---/ One Euro filter (Casiez et al. 2012)
+# A low-pass filter whose cutoff frequency rises with the speed of the signal:
+# slow movements are smoothed heavily (less jitter), fast movements follow the
+# signal closely (less lag). 'min-cutoff' sets the jitter at rest, 'beta' how
+# quickly the filter opens up when the ball moves.
+class OneEuroFilter:
+
+    def __init__(self, min_cutoff=1.0, beta=0.0, d_cutoff=1.0):
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.d_cutoff = d_cutoff
+        self.reset()
+
+    @staticmethod
+    def smoothing_factor(cutoff, dt):
+        tau = 1.0 / (2 * math.pi * cutoff)
+        return 1.0 / (1.0 + tau / dt)
+
+    def update(self, value, timestamp):
+        if self.value is None:
+            self.value = value
+            self.derivative = 0.0
+            self.timestamp = timestamp
+            return self.value
+
+        dt = timestamp - self.timestamp
+        if dt <= 0:
+            return self.value
+        self.timestamp = timestamp
+
+        # Smooth the derivative, then use it to adapt the cutoff
+        alpha_d = self.smoothing_factor(self.d_cutoff, dt)
+        self.derivative = alpha_d * (value - self.value) / dt + (1 - alpha_d) * self.derivative
+
+        cutoff = self.min_cutoff + self.beta * abs(self.derivative)
+        alpha = self.smoothing_factor(cutoff, dt)
+        self.value = alpha * value + (1 - alpha) * self.value
+        return self.value
+
+    def reset(self):
+        self.value = None
+        self.derivative = 0.0
+        self.timestamp = None
+
+
+# -----------------------------------------/
+# ---/ Create a filter from its config entry
+def create_filter(settings, moving_average_strength):
+    # Without settings, fall back to the moving average used so far
+    if not settings:
+        return ExponentialFilter(moving_average_strength)
+
+    filter_type = settings.get('type', 'one-euro')
+    if filter_type == 'one-euro':
+        return OneEuroFilter(settings.get('min-cutoff', 1.0),
+                             settings.get('beta', 0.0),
+                             settings.get('d-cutoff', 1.0))
+    if filter_type == 'moving-average':
+        return ExponentialFilter(settings.get('strength', moving_average_strength))
+    raise ValueError(f"Unknown filter type: {filter_type}")
@@ -0,0 +1,205 @@
+import os
+import time
+import numpy as np
+from multiprocessing import shared_memory, resource_tracker
+
+# ===========================================================================//
+# -----------------------------------------------------------------// Frame Bus
+
+# Shared-memory ring buffer the recorder publishes its frames into, so other
+# local tools (HSV tuner, preview, archiver) can read them without opening the
+# camera again. Frames are plain NumPy views on the shared block, nothing is
+# pickled or copied on the way.
+#
+# Layout of the block:
+#   header  int64[8]  magic, height, width, channels, slot count, latest sequence, writer pid
+#   slots   int64[slot count]  sequence number of the frame in each slot
+#   stamps  float64[slot count]  timestamp of the frame in each slot
+#   frames  uint8[slot count, height, width, channels]
+#
+# The writer sets a slot's sequence to -1 while it writes and to the frame's
+# sequence number when it is done. A reader checks the sequence before and
+# after using a slot to make sure the writer did not lap it in between.
+
+MAGIC = 0x4446504946425553  # 'DFPIFBUS'
+HEADER_SIZE = 8
+
+# -----------------------------------------/
+# ---/ Map the shared block to NumPy views
+def map_views(buffer, height, width, channels, slot_count):
+    offset = 0
+    header = np.ndarray((HEADER_SIZE,), dtype=np.int64, buffer=buffer, offset=offset)
+    offset += header.nbytes
+    sequences = np.ndarray((slot_count,), dtype=np.int64, buffer=buffer, offset=offset)
+    offset += sequences.nbytes
+    stamps = np.ndarray((slot_count,), dtype=np.float64, buffer=buffer, offset=offset)
+    offset += stamps.nbytes
+    frames = np.ndarray((slot_count, height, width, channels), dtype=np.uint8, buffer=buffer, offset=offset)
+    return header, sequences, stamps, frames
+
+# -----------------------------------------/
+# ---/ Check whether a process is still running
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # it exists but belongs to another user
+    return True
+
+# -----------------------------------------/
+# ---/ Size of the shared block in bytes
+def block_size(height, width, channels, slot_count):
+    return 8 * HEADER_SIZE + 16 * slot_count + slot_count * height * width * channels
+
+
+# -----------------------------------------/
+# ---/ Publishing side, owned by the recorder
+class FrameBusWriter:
+
+    def __init__(self, name, shape, slot_count=4):
+        height, width = shape[:2]
+        channels = shape[2] if len(shape) > 2 else 1
+        self.name = name
+        self.shape = shape
+        self.slot_count = slot_count
+
+        # Remove a block left behind by a crashed recorder, but never take over
+        # the bus of a recorder that is still running
+        try:
+            existing = shared_memory.SharedMemory(name=name)
+        except FileNotFoundError:
+            existing = None
+        if existing is not None:
+            owner = 0
+            if existing.size >= 8 * HEADER_SIZE:
+                header = np.ndarray((HEADER_SIZE,), dtype=np.int64, buffer=existing.buf)
+                if header[0] == MAGIC:
+                    owner = int(header[6])
+                del header
+            in_use = owner > 0 and process_alive(owner)
+            existing.close()
+            if in_use:
+                resource_tracker.unregister(existing._name, 'shared_memory')
+                raise IOError(f"Frame bus {name} is in use by process {owner}, set a different frame-bus-name")
+            existing.unlink()
+
+        self.shm = shared_memory.SharedMemory(name=name, create=True, size=block_size(height, width, channels, slot_count))
+        self.header, self.sequences, self.stamps, self.frames = map_views(self.shm.buf, height, width, channels, slot_count)
+        self.sequences[:] = -1
+        self.header[1:7] = (height, width, channels, slot_count, -1, os.getpid())
+        self.header[0] = MAGIC
+        self.sequence = -1
+
+    # -----------------------------------------/
+    # ---/ Publish a frame, it is copied once into the next slot
+    def publish(self, frame, timestamp=None):
+        if frame.shape != self.shape:
+            return False
+        self.sequence += 1
+        slot = self.sequence % self.slot_count
+        self.sequences[slot] = -1
+        self.frames[slot].reshape(frame.shape)[...] = frame
+        self.stamps[slot] = time.time() if timestamp is None else timestamp
+        self.sequences[slot] = self.sequence
+        self.header[5] = self.sequence
+        return True
+
+    # -----------------------------------------/
+    # ---/ Close and remove the shared block
+    def close(self):
+        self.header[0] = 0
+        del self.header, self.sequences, self.stamps, self.frames
+        self.shm.close()
+        self.shm.unlink()
+
+
+# -----------------------------------------/
+# ---/ Reading side, used by any other local process
+class FrameBusReader:
+
+    def __init__(self, name, timeout=5.0):
+        self.name = name
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                self.shm = shared_memory.SharedMemory(name=name)
+            except FileNotFoundError:
+                if time.monotonic() > deadline:
+                    raise IOError(f"No frame bus named {name}, is the recorder running with enable-frame-bus?")
+                time.sleep(0.1)
+                continue
+
+            # The reader does not own the block, keep the resource tracker from
+            # removing it when this process exits
+            resource_tracker.unregister(self.shm._name, 'shared_memory')
+
+            # A writer that is still setting the block up has not written the magic yet
+            header = np.ndarray((HEADER_SIZE,), dtype=np.int64, buffer=self.shm.buf)
+            if header[0] == MAGIC:
+                break
+            del header
+            self.shm.close()
+            if time.monotonic() > deadline:
+                raise IOError(f"Shared memory {name} is not a frame bus")
+            time.sleep(0.1)
+
+        height, width, channels, slot_count = (int(v) for v in header[1:5])
+        del header
+
+        self.slot_count = slot_count
+        self.shape = (height, width, channels) if channels > 1 else (height, width)
+        self.header, self.sequences, self.stamps, self.frames = map_views(self.shm.buf, height, width, channels, slot_count)
+        # Readers only ever look at the frames
+        self.frames.flags.writeable = False
+        self.last_sequence = -1
+
+    # -----------------------------------------/
+    # ---/ The writer closed this block (recorder stopped or the frame size changed),
+    # a new FrameBusReader has to be created to get frames again
+    @property
+    def closed(self):
+        return self.header[0] != MAGIC
+
+    # -----------------------------------------/
+    # ---/ Latest frame as (sequence, timestamp, frame view), or None if there is no new frame
+    # The view points into the ring and stays valid until the writer laps it
+    # (slot count frames later), copy it if it has to be kept longer.
+    def read(self):
+        if self.closed:
+            return None
+        sequence = int(self.header[5])
+        if sequence < 0 or sequence == self.last_sequence:
+            return None
+        slot = sequence % self.slot_count
+        timestamp = float(self.stamps[slot])
+        if self.sequences[slot] != sequence:
+            return None  # the writer is already overwriting this slot
+        self.last_sequence = sequence
+        return sequence, timestamp, self.frames[slot].reshape(self.shape)
+
+    # -----------------------------------------/
+    # ---/ Check the frame returned by read() has not been overwritten since
+    def is_valid(self, sequence):
+        return self.sequences[sequence % self.slot_count] == sequence
+
+    # -----------------------------------------/
+    # ---/ Block until a new frame arrives
+    def wait(self, timeout=1.0, poll_interval=0.002):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            sample = self.read()
+            if sample is not None:
+                return sample
+            time.sleep(poll_interval)
+        return None
+
+    # -----------------------------------------/
+    # ---/ Detach from the shared block
+    def close(self):
+        del self.header, self.sequences, self.stamps, self.frames
+        try:
+            self.shm.close()
+        except BufferError:
+            pass  # the caller still holds frame views, the mapping goes away with the process
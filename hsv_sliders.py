@@ -2,10 +2,12 @@ import argparse
 import cv2
 import numpy as np
 from imutils.video import VideoStream
+from framebus import FrameBusReader
 
 def parse_arguments():
     parser = argparse.ArgumentParser(description='Object tracking with optional video input.')
     parser.add_argument('-v', '--video', help='Path to the video file (optional).', default=None)
+    parser.add_argument('-b', '--bus', help='Name of the recorder\'s frame bus to read from instead of the camera (optional).', default=None)
     return parser.parse_args()
 
 def nothing(x):
@@ -29,6 +31,7 @@ lower_hsv, upper_hsv = read_hsv_values("color.txt")
 
 args = parse_arguments()
 video_path = args.video
+bus_name = args.bus
 video_playing = True
 
 # Initialize the webcam
@@ -36,6 +39,11 @@ video_playing = True
 if video_path is not None:
     vs = cv2.VideoCapture(video_path)
     fps = vs.get(cv2.CAP_PROP_FPS)
+elif bus_name is not None:
+    # Attach to the frames the recorder is already capturing
+    vs = FrameBusReader(bus_name)
+    fps = 30
+    frame = None
 else:
     vs = VideoStream(src=1).start()
     fps = 30  # Assume a standard FPS for a webcam if not using a video file
@@ -62,6 +70,22 @@ while True:
             ret, frame = vs.read()
             if not ret:
                 break  # End of video file
+    elif bus_name is not None:
+        # Keep showing the last frame while no new one has arrived
+        sample = vs.wait(timeout=5.0 if frame is None else frame_delay / 1000)
+        if sample is None and vs.closed:
+            # The recorder recreated the bus or stopped, wait for the new one
+            print(f"Frame bus {bus_name} closed, attaching again...")
+            vs.close()
+            vs = FrameBusReader(bus_name, timeout=30.0)
+            continue
+        if sample is not None:
+            # The ring slot is overwritten a few frames later, keep a copy that
+            # stays intact while it is shown, and drop it if the copy was torn
+            sequence, timestamp, view = sample
+            new_frame = view.copy()
+            if vs.is_valid(sequence):
+                frame = new_frame
     else:
         frame = vs.read()
 
@@ -105,6 +129,8 @@ while True:
 # Release the webcam and destroy all windows
 if video_path is not None:
     vs.release()
+elif bus_name is not None:
+    vs.close()
 else:
     vs.stream.release()
 cv2.destroyAllWindows()
@@ -0,0 +1,148 @@
+import json
+import time
+from collections import deque
+import numpy as np
+import cv2
+
+# ===========================================================================//
+# ---------------------------------------------------------------// Frame Metrics
+
+# Hot-path instrumentation for the tracking loop. Everything here is only
+# touched when 'enable-metrics' is set, the main loop guards every call with
+# that flag so a disabled run pays nothing but a boolean check per stage.
+
+class FrameMetrics:
+
+    # -----------------------------------------/
+    # ---/ Init
+    def __init__(self, window=300, report_interval=5.0):
+        self.window = window
+        self.report_interval = report_interval
+
+        self.stages = {}      # stage name -> deque of durations (seconds)
+        self.counters = {}    # counter name -> int
+        self.gauges = {}      # gauge name -> last value
+        self.latency = deque(maxlen=window)
+        self.frame_times = deque(maxlen=window)
+
+        self.frame_start = None
+        self.last_lap = None
+        self.capture_time = None
+        self.last_frame_start = None
+        self.last_report = time.perf_counter()
+        self.overlay_summary = None
+        self.last_overlay = 0
+
+    # -----------------------------------------/
+    # ---/ Start timing a new frame
+    def start_frame(self):
+        now = time.perf_counter()
+        if self.last_frame_start is not None:
+            period = now - self.last_frame_start
+            self.frame_times.append(period)
+        self.last_frame_start = now
+        self.frame_start = now
+        self.last_lap = now
+        self.capture_time = None
+
+    # -----------------------------------------/
+    # ---/ Record the time spent since the previous lap under a stage name
+    def lap(self, stage):
+        now = time.perf_counter()
+        samples = self.stages.get(stage)
+        if samples is None:
+            samples = self.stages[stage] = deque(maxlen=self.window)
+        samples.append(now - self.last_lap)
+        self.last_lap = now
+
+    # -----------------------------------------/
+    # ---/ Mark the moment the frame was captured, on the time.monotonic() clock
+    # Without a grab timestamp the moment it was handed over is used instead
+    def mark_capture(self, timestamp=None):
+        self.capture_time = time.monotonic() if timestamp is None else timestamp
+
+    # -----------------------------------------/
+    # ---/ Mark the moment the detection for the current frame is known
+    def mark_detection(self):
+        if self.capture_time is not None:
+            self.latency.append(time.monotonic() - self.capture_time)
+
+    # -----------------------------------------/
+    # ---/ Counters and gauges
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def gauge(self, name, value):
+        self.gauges[name] = value
+
+    # -----------------------------------------/
+    # ---/ Check whether a periodic report is due
+    def report_due(self):
+        now = time.perf_counter()
+        if now - self.last_report >= self.report_interval:
+            self.last_report = now
+            return True
+        return False
+
+    # -----------------------------------------/
+    # ---/ Summarise the rolling window (times in milliseconds)
+    def summary(self):
+        def percentiles(samples):
+            if not samples:
+                return {'p50': 0.0, 'p95': 0.0, 'p99': 0.0}
+            p50, p95, p99 = np.percentile(np.fromiter(samples, dtype=np.float64), [50, 95, 99]) * 1000
+            return {'p50': round(p50, 3), 'p95': round(p95, 3), 'p99': round(p99, 3)}
+
+        fps = 0.0
+        if self.frame_times:
+            fps = len(self.frame_times) / sum(self.frame_times)
+
+        return {
+            'fps': round(fps, 2),
+            'frame': percentiles(self.frame_times),
+            'latency': percentiles(self.latency),
+            'stages': {name: percentiles(samples) for name, samples in self.stages.items()},
+            'counters': dict(self.counters),
+            'gauges': dict(self.gauges),
+        }
+
+    # -----------------------------------------/
+    # ---/ Single line for the periodic log
+    def format_line(self, summary=None):
+        summary = summary or self.summary()
+        stages = ' '.join(f"{name}={s['p50']:.1f}/{s['p95']:.1f}/{s['p99']:.1f}" for name, s in summary['stages'].items())
+        latency = summary['latency']
+        counters = ' '.join(f"{name}={value}" for name, value in summary['counters'].items())
+        gauges = ' '.join(f"{name}={value}" for name, value in summary['gauges'].items())
+        return (f"[metrics] fps={summary['fps']:.1f} "
+                f"latency={latency['p50']:.1f}/{latency['p95']:.1f}/{latency['p99']:.1f}ms "
+                f"{stages} {counters} {gauges}").strip()
+
+    # -----------------------------------------/
+    # ---/ JSON payload for the MQTT metrics topic
+    def to_json(self, summary=None):
+        return json.dumps(summary or self.summary())
+
+    # -----------------------------------------/
+    # ---/ Draw the overlay in the bottom left corner of the frame
+    def draw_overlay(self, frame):
+        # Percentiles are only refreshed a few times per second for the overlay
+        now = time.perf_counter()
+        if self.overlay_summary is None or now - self.last_overlay >= 0.5:
+            self.overlay_summary = self.summary()
+            self.last_overlay = now
+        summary = self.overlay_summary
+        lines = [f"FPS: {summary['fps']:.1f}"]
+        latency = summary['latency']
+        lines.append(f"Latency p50/p95/p99: {latency['p50']:.1f}/{latency['p95']:.1f}/{latency['p99']:.1f} ms")
+        for name, s in summary['stages'].items():
+            lines.append(f"{name}: {s['p50']:.1f}/{s['p95']:.1f}/{s['p99']:.1f} ms")
+        for name, value in summary['counters'].items():
+            lines.append(f"{name}: {value}")
+        for name, value in summary['gauges'].items():
+            lines.append(f"{name}: {value}")
+
+        startY = frame.shape[0] - 10 - 20 * (len(lines) - 1)
+        for line in lines:
+            cv2.putText(frame, line, (10, startY), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 255), 1)
+            startY += 20
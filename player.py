@@ -1,6 +1,7 @@
 import sys
 import csv
-import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 import cv2
 import serial
 
@@ -35,14 +36,19 @@ max_input = 90
 
 
 
-def playback_csv(csv_file, serial_connection):
+# Samples are scheduled against the start of the file, so drawing and serial
+# writes don't add up to a drift. Serial writes run on a single writer thread
+# (which keeps them in order) with at most one write in flight.
+async def playback_csv(csv_file, serial_connection, serial_executor):
+    loop = asyncio.get_running_loop()
     last_output_x = min_x + (max_x - min_x) / 2
     last_output_y = min_y + (max_y - min_y) / 2
     with open(csv_file, 'r') as file:
         reader = csv.reader(file)
         next(reader)  # Skip the header
 
-        previous_time = 0
+        start_time = loop.time()
+        pending_write = None
         for row in reader:
             
             # 0 Time
@@ -61,8 +67,9 @@ def playback_csv(csv_file, serial_connection):
             height = int(row[2])
             base_x = int(row[3])
             base_y = int(row[4])
-            pos_x = int(row[5])
-            pos_y = int(row[6])
+            # Positions are recorded with sub-pixel precision
+            pos_x = int(round(float(row[5])))
+            pos_y = int(round(float(row[6])))
             diameter = float(row[7])
             angle_x = float(row[8])
             angle_y = float(row[9])
@@ -82,10 +89,10 @@ def playback_csv(csv_file, serial_connection):
             if key == ord("q"):
                 sys.exit(0)
             
-            # Calculate the sleep time
-            sleep_time = current_time - previous_time
+            # Wait until the sample is due
+            sleep_time = start_time + current_time - loop.time()
             if sleep_time > 0:
-                time.sleep(sleep_time)
+                await asyncio.sleep(sleep_time)
 
             # remap
             output_x = min_x + (angle_x - min_input) * (max_x - min_x) / (max_input - min_input)
@@ -103,7 +110,9 @@ def playback_csv(csv_file, serial_connection):
 
             # Prepare the data string
             data_string = f"{output_x},{output_y}\n"
-            serial_connection.write(data_string.encode())
+            if pending_write is not None:
+                await pending_write
+            pending_write = loop.run_in_executor(serial_executor, serial_connection.write, data_string.encode())
 
             # diff_x = abs(output_x - last_output_x)
             # diff_y = abs(output_y - last_output_y)
@@ -147,13 +156,15 @@ def playback_csv(csv_file, serial_connection):
             
             last_output_x = output_x
             last_output_y = output_y
-            previous_time = current_time
 
-def read_and_playback(csv_files, port, baud_rate):
-    with serial.Serial(port, baud_rate) as serial_connection:
+        if pending_write is not None:
+            await pending_write
+
+async def read_and_playback(csv_files, port, baud_rate):
+    with serial.Serial(port, baud_rate) as serial_connection, ThreadPoolExecutor(max_workers=1) as serial_executor:
         for file in csv_files:
-            playback_csv(file, serial_connection)
+            await playback_csv(file, serial_connection, serial_executor)
             print(f"Completed playback for {file}")
 
-read_and_playback(csv_files, serial_port, baud_rate)
+asyncio.run(read_and_playback(csv_files, serial_port, baud_rate))
 cv2.destroyAllWindows()
\ No newline at end of file
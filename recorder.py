@@ -11,12 +11,17 @@ import math
 import csv
 import yaml
 from collections import deque
-from imutils.video import VideoStream
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-import paho.mqtt.client as mqtt
 import uuid
 
 from utils import *
+from metrics import FrameMetrics
+from capture import CameraGroup
+from framebus import FrameBusWriter
+from session import SessionWriter, default_session_name
+from control import ControlPlane
+from tracker import Tracker
 
 
 # ===========================================================================//
@@ -25,6 +30,7 @@ from utils import *
 def parse_arguments():
     parser = argparse.ArgumentParser(description='Object tracking with optional video input.')
     parser.add_argument('-v', '--video', help='Path to the video file (optional).', default=None)
+    parser.add_argument('-s', '--session', help='Name for the recorded sessions (optional, defaults to the start time).', default=None)
     return parser.parse_args()
 
 # ===========================================================================//
@@ -38,9 +44,13 @@ is_setting_exclusion = False # Flag to check if we are setting exclusion zone
 is_dragging = False
 selected_point_index = -1
 video_playing = True
+active_camera = 0 # Camera shown in the frame window and edited with the mouse
+camera_count = 1
 
 config = read_config("config.yaml")
 video_source = config['video-source']
+video_sources = video_source if isinstance(video_source, list) else [video_source]
+worker_count = config.get('worker-count', 0) or os.cpu_count()
 lower_hsv = np.array(config['HSV-values']['lower-hsv'])
 upper_hsv = np.array(config['HSV-values']['upper-hsv'])
 show_mask = config['show-mask']
@@ -53,6 +63,15 @@ broker_address = config['broker-address']
 username = config['username']
 password = config['password']
 topic_prefix = config['topic-prefix']
+mqtt_reconnect_delay = config.get('mqtt-reconnect-delay', [1, 30])
+enable_metrics = config.get('enable-metrics', False)
+show_metrics = config.get('show-metrics', False)
+metrics_interval = config.get('metrics-interval', 5.0)
+publish_angles = config.get('publish-angles', False)
+enable_frame_bus = config.get('enable-frame-bus', False)
+frame_bus_name = config.get('frame-bus-name', 'dfpi-frames')
+frame_bus_slots = config.get('frame-bus-slots', 4)
+sessions_directory = config.get('sessions-directory', 'sessions')
 
 config_internal = read_config("config_internal.yaml")
 fixed_point = tuple(config_internal['fixed-point'])
@@ -103,35 +122,22 @@ def mouse_callback(event, x, y, flags, param):
 
 
 # ===========================================================================//
-# ----------------------------------------------------------------------// MQTT
+# ------------------------------------------------------------------// Commands
 
 # -----------------------------------------/
-# ---/ MQTT On Connect Callback
-def on_connect(client, userdata, flags, rc):
-    print("Connected to MQTT Broker with result code " + str(rc))
-    client.subscribe(f"{topic_prefix}/record")
-
-# -----------------------------------------/
-# ---/ MQTT On Disconnect Callback
-def on_disconnect(client, userdata, rc):
-    print("Disconnected from MQTT Broker with result code " + str(rc))
-
-# -----------------------------------------/
-# ---/ MQTT On Message Callback
-def on_message(client, userdata, msg):
-    global is_recording
-    message = msg.payload.decode()
-    msg_id, command = message.split('|', 1)
-
-    # Ignore if the message is from this script
-    if msg_id == unique_id:
-        return
-    
-    if enable_mqtt:
-        if command == "START_RECORDING" and not is_recording:
-            start_recording()
-        elif command == "STOP_RECORDING" and is_recording:
-            stop_recording()
+# ---/ Handle a command from the control plane
+# Runs on the frame loop only. Commands typed here are passed on to the other
+# recorders over MQTT, commands received over MQTT are not sent back.
+# frame_time is the time the current frame was taken, recordings start at it.
+def handle_command(source, command, frame_time):
+    if command == "START_RECORDING" and not is_recording:
+        if source == 'keyboard':
+            control.broadcast(command)
+        start_recording(frame_time)
+    elif command == "STOP_RECORDING" and is_recording:
+        if source == 'keyboard':
+            control.broadcast(command)
+        stop_recording()
 
 
 
@@ -139,28 +145,45 @@ def on_message(client, userdata, msg):
 # -----------------------------------------------------------------// Recording
 
 # -----------------------------------------/
-# ---/ Start recording function
-def start_recording():
-    global is_recording, csv_file, csv_writer, recording_start_time, recording_count
+# ---/ Metadata stored with a session
+def session_meta():
+    return {
+        'source': video_path if video_path is not None else video_sources,
+        'cameras': camera_count,
+        'fps': fps,
+        'frame-width': frame_width,
+        'HSV-values': config['HSV-values'],
+        'filter': config.get('filter'),
+        'fixed-points': [list(tracker.fixed_point) for tracker in trackers],
+        'exclusion-zones': [[list(point) for point in tracker.exclusion_points] for tracker in trackers],
+    }
+
+# -----------------------------------------/
+# ---/ Start recording function, the frame taken at start_time is at 0 in the session
+def start_recording(start_time):
+    global is_recording, session, recording_start_time
     if not is_recording:
         is_recording = True
-        while os.path.exists(get_unique_filename('angles', recording_count)):
-            recording_count += 1
-        csv_file = open(get_unique_filename('angles', recording_count), 'w', newline='')
-        csv_writer = csv.writer(csv_file)
-        csv_writer.writerow(['Time', 'Width', 'Height', 'Base X', 'Base Y', 'Pos X', 'Pos Y', 'Diameter', 'Angle_X', 'Angle_Y'])
-        recording_start_time = time.time()
+        header = ['Time', 'Width', 'Height', 'Base X', 'Base Y', 'Pos X', 'Pos Y', 'Diameter', 'Angle_X', 'Angle_Y']
+        # Additional cameras are appended so the first ten columns keep their meaning
+        for camera in range(1, camera_count):
+            header += [f'{name} {camera}' for name in ['Base X', 'Base Y', 'Pos X', 'Pos Y', 'Diameter', 'Angle_X', 'Angle_Y']]
+        if camera_count > 1:
+            header.append('Skew')
+        session = SessionWriter(sessions_directory, session_name or default_session_name(), header, session_meta(), fps)
+        print(f"Recording session {session.name}")
+        recording_start_time = start_time
         
 # -----------------------------------------/
 # ---/ Stop recording function
 def stop_recording():
-    global is_recording, csv_file, csv_writer
+    global is_recording, session
     if is_recording:
         is_recording = False
-        if csv_file:
-            csv_file.close()
-            csv_file = None
-            csv_writer = None
+        if session:
+            session.close()
+            print(f"Saved session {session.name}")
+            session = None
 
 
 # ===========================================================================//
@@ -170,30 +193,29 @@ if __name__ == '__main__':
 
     args = parse_arguments()
     video_path = args.video
+    session_name = args.session
 
-    # Initialize MQTT client
-    if enable_mqtt:
-        mqtt_client = mqtt.Client()
-        mqtt_client.username_pw_set(username, password)
-        mqtt_client.on_connect = on_connect
-        mqtt_client.on_disconnect = on_disconnect
-        mqtt_client.on_message = on_message
-        mqtt_client.connect(broker_address, 1883, 60)
-        mqtt_client.loop_start()
-
-    # Initialize VideoStream or VideoCapture
-    # if video_path is not None:
-    #     vs = cv2.VideoCapture(video_path)
-    # else:
-    #     vs = VideoStream(src=video_source).start()
+    # Initialize the control plane, it connects to MQTT in the background
+    control = ControlPlane(unique_id, topic_prefix, enable_mqtt, broker_address, username, password,
+                           min_reconnect_delay=mqtt_reconnect_delay[0], max_reconnect_delay=mqtt_reconnect_delay[1]).start()
+
+    # Initialize the video file or the camera threads
     if video_path is not None:
         vs = cv2.VideoCapture(video_path)
         fps = vs.get(cv2.CAP_PROP_FPS)
     else:
-        vs = VideoStream(src=video_source).start()
-        fps = 30  # Assume a standard FPS for a webcam if not using a video file
+        cameras = CameraGroup(video_sources).start()
+        fps = cameras.fps
+        camera_count = len(cameras)
 
     frame_delay = int(1000 / fps)
+    skew = 0
+
+    # Initialise the per-frame instrumentation
+    metrics = None
+    if enable_metrics:
+        metrics = FrameMetrics(report_interval=metrics_interval)
+    last_frame_index = -1
 
     # Set the mouse callback function for the window
     cv2.namedWindow("Frame")
@@ -202,119 +224,119 @@ if __name__ == '__main__':
     # allow the camera or video file to warm up
     time.sleep(2.0)
 
-    # Initialise the output variables
-    pos_x = 0
-    pos_y = 0
-    diameter = 0
-    angle_x = 0
-    angle_y = 0
+    # Initialise one tracker per camera, they hold the output values.
+    # Multiple cameras are processed in parallel on a shared pool, OpenCV
+    # releases the GIL while it works on a frame
+    trackers = [Tracker.from_config(config, config_internal, camera=i, metrics=metrics if camera_count == 1 else None)
+                for i in range(camera_count)]
+    results = [tracker.result for tracker in trackers]
+    pool = None
+    if camera_count > 1:
+        pool = ThreadPoolExecutor(max_workers=min(worker_count, camera_count))
 
-    # Initialise the average variables
-    pos_x_avg = 0
-    pos_y_avg = 0
-    diameter_avg = 0
-    angle_x_avg = 0
-    angle_y_avg = 0
+    # Frame bus writers, one per camera, created once the frame size is known
+    frame_buses = [None] * camera_count
 
     last_recorded_time = time.time()
 
     # Initialize recording variables
     is_recording = False
     recording_start_time = None
-    csv_file = None
-    csv_writer = None
-    recording_count = 0
+    session = None
 
     # Create the shortcuts image
     shortcuts_image = create_shortcuts_image()
     cv2.namedWindow("Shortcuts")
 
-    # Calculate the linear, log and exponential parameters
-    input_range = np.array(diameter_bounds)
-    output_range = np.array(angle_bounds)
-    linear_params = calculate_linear_params(input_range, output_range)
-    log_params = calculate_log_params(input_range, output_range)
-
     # Main loop
     while (running):
         
         # Record the current time
         current_time = time.time()
+        if enable_metrics:
+            metrics.start_frame()
 
-        # grab the current frame
+        # grab the current frame(s)
+        # Video files are filtered on their own clock so playback speed doesn't change the result
         if video_path is not None:
             if video_playing:
                 ret, new_frame = vs.read()
                 if not ret:
                     break  # End of video file
+                frame_index = int(vs.get(cv2.CAP_PROP_POS_FRAMES))
+                new_frames = [new_frame]
+                frame_timestamps = [vs.get(cv2.CAP_PROP_POS_MSEC) / 1000]
         else:
-            new_frame = vs.read()
-        
-        frame = new_frame.copy()
-        frame = imutils.resize(frame, width=frame_width)
-
-        # if we are viewing a video and we did not grab a frame,
-        # then we have reached the end of the video
-        if frame is None:
-            break
+            sample, skew = cameras.read()
+            frame_index = sample[0][1]
+            new_frames = [frame for timestamp, index, frame in sample]
+            frame_timestamps = [timestamp for timestamp, index, frame in sample]
+
+        if enable_metrics:
+            metrics.lap('capture')
+            # Camera frames carry their grab time, so the latency includes the time spent in
+            # the buffer. Video files are read in order and never drop frames, their
+            # timestamps are positions in the file
+            if video_path is None:
+                metrics.mark_capture(frame_timestamps[0])
+            else:
+                metrics.mark_capture()
+            # The camera threads hand out the same frame until a new one arrives
+            if video_playing and frame_index == last_frame_index:
+                metrics.count('duplicate')
+            last_frame_index = frame_index
+            if video_path is None:
+                metrics.gauge('camera-queue', cameras.pending())
+                metrics.gauge('camera-dropped', cameras.dropped())
+                if camera_count > 1:
+                    metrics.gauge('skew-ms', round(skew * 1000, 1))
+
+        # The camera shown in the frame window, keep its exclusion zone live while it is being edited
+        tracker = trackers[active_camera]
+        if is_setting_exclusion:
+            tracker.set_exclusion_points(exclusion_points)
 
         if video_playing:
+            # Resize the frames into the trackers' buffers, find the ball and calculate the angles
+            if pool is None:
+                results = [trackers[0].process(new_frames[0], frame_timestamps[0])]
+            else:
+                results = list(pool.map(lambda i: trackers[i].process(new_frames[i], frame_timestamps[i]), range(camera_count)))
+                if enable_metrics:
+                    metrics.lap('process')
+                    metrics.mark_detection()
+            if enable_metrics and not all(r.detected for r in results):
+                metrics.count('no-detection')
+
+            # Publish the filtered angles of all cameras
+            if enable_mqtt and publish_angles and any(r.detected for r in results):
+                control.publish("angles", ','.join(f"{r.angle_x:.3f},{r.angle_y:.3f}" for r in results))
+
+            # Publish the resized frames, before anything is drawn on them, for other local tools
+            if enable_frame_bus:
+                for camera in range(camera_count):
+                    # A new frame size needs a new block, readers have to attach again
+                    if frame_buses[camera] is not None and frame_buses[camera].shape != trackers[camera].frame.shape:
+                        print(f"Frame size changed, recreating frame bus {frame_buses[camera].name}")
+                        frame_buses[camera].close()
+                        frame_buses[camera] = None
+                    if frame_buses[camera] is None:
+                        frame_buses[camera] = FrameBusWriter(camera_config_key(frame_bus_name, camera), trackers[camera].frame.shape, frame_bus_slots)
+                    frame_buses[camera].publish(trackers[camera].frame, frame_timestamps[camera])
+                if enable_metrics:
+                    metrics.lap('frame-bus')
+        else:
+            tracker.resize(new_frames[0])
 
-            # resize the frame, blur it, and convert it to the HSV
-            # color space
-            blurred = cv2.GaussianBlur(frame, (11, 11), 0)
-            hsv = cv2.cvtColor(blurred, cv2.COLOR_BGR2HSV)
-
-            # construct a mask for the color "green", then perform
-            # a series of dilations and erosions to remove any small
-            # blobs left in the mask
-            mask = cv2.inRange(hsv, lower_hsv, upper_hsv)
-            mask = cv2.erode(mask, None, iterations=2)
-            mask = cv2.dilate(mask, None, iterations=2)
-
-            # Create and apply the exclusion mask
-            exclusion_mask = create_exclusion_mask(mask, exclusion_points)
-            mask = cv2.bitwise_and(mask, mask, mask=cv2.bitwise_not(exclusion_mask))
-
-            # find contours in the mask and initialize the current
-            # (x, y) center of the ball
-            cnts = cv2.findContours(mask.copy(), cv2.RETR_EXTERNAL,
-                cv2.CHAIN_APPROX_SIMPLE)
-            cnts = imutils.grab_contours(cnts)
-            center = None
-
-            # only proceed if at least one contour was found
-            if len(cnts) > 0:
-                # find the largest contour in the mask, then use
-                # it to compute the minimum enclosing circle and
-                # centroid
-                c = max(cnts, key=cv2.contourArea)
-                ((x, y), radius) = cv2.minEnclosingCircle(c)
-                M = cv2.moments(c)
-                center = (int(M["m10"] / M["m00"]), int(M["m01"] / M["m00"]))
-
-            # Draw a line from the fixed point to the center of the ball
-            if center is not None:
-
-                pos_x = center[0]
-                pos_y = center[1]
-
-                # Calculate the angle
-                angle_x = calculate_angle(fixed_point, center)
-                diameter = radius * 2
-                
-                # angle_y = linear_interpolation(diameter, linear_params)
-                angle_y = logarithmic_interpolation(diameter, log_params)
-
-                pos_x_avg = pos_x_avg * (moving_average_strength - 1) / moving_average_strength + pos_x / moving_average_strength
-                pos_y_avg = pos_y_avg * (moving_average_strength - 1) / moving_average_strength + pos_y / moving_average_strength
-                diameter_avg = diameter_avg * (moving_average_strength - 1) / moving_average_strength + diameter / moving_average_strength
-                angle_x_avg = angle_x_avg * (moving_average_strength - 1) / moving_average_strength + angle_x / moving_average_strength
-                angle_y_avg = angle_y_avg * (moving_average_strength - 1) / moving_average_strength + angle_y / moving_average_strength
+        # The tracker's frame buffer is overwritten on the next frame, so it is safe to draw on
+        result = results[active_camera]
+        frame = tracker.frame
 
         # cv2.imshow("Mask", mask)
         # key = cv2.waitKey(1) & 0xFF
         key = cv2.waitKey(frame_delay) & 0xFF
+        if enable_metrics:
+            metrics.lap('wait')
 
         # Handle space to pause video
         if key == ord(" "):
@@ -341,79 +363,125 @@ if __name__ == '__main__':
             if is_setting_exclusion:
                 is_setting_exclusion = False
                 print("Exclusion zone set: " + str(exclusion_points))
-                save_exclusion_points_to_config("config_internal.yaml", exclusion_points)
+                tracker.set_exclusion_points(exclusion_points)
+                save_exclusion_points_to_config("config_internal.yaml", exclusion_points, active_camera)
 
         # record new fixed_point position when pressing 'p'
         if key == ord("p"):
             fixed_point = (mouseX, mouseY)
-            save_fixed_point_to_config("config_internal.yaml", fixed_point)
+            tracker.set_fixed_point(fixed_point)
+            save_fixed_point_to_config("config_internal.yaml", fixed_point, active_camera)
+
+        # Switch the camera shown and edited with 'c' key
+        if key == ord("c"):
+            if camera_count > 1 and not is_setting_exclusion:
+                active_camera = (active_camera + 1) % camera_count
+                fixed_point = trackers[active_camera].fixed_point
+                exclusion_points = list(trackers[active_camera].exclusion_points)
+                # Draw the new camera's calibration on its own frame from this iteration on
+                tracker = trackers[active_camera]
+                result = results[active_camera]
+                frame = tracker.frame
+                print(f"Showing camera {active_camera}")
 
         # Toggle recording with 'r' key
         if key == ord("r"):
             if video_playing:
-                if is_recording:
-                    if enable_mqtt:
-                        mqtt_client.publish(f"{topic_prefix}/record", unique_id + "|STOP_RECORDING")
-                        print(f"publishing {unique_id}|STOP_RECORDING to {topic_prefix}/record")
-                    stop_recording()
-                else:
-                    if enable_mqtt:
-                        mqtt_client.publish(f"{topic_prefix}/record", unique_id + "|START_RECORDING")
-                        print(f"publishing {unique_id}|START_RECORDING to {topic_prefix}/record")
-                    start_recording()
+                control.submit('keyboard', "STOP_RECORDING" if is_recording else "START_RECORDING")
+
+        # Handle the commands from the keyboard and MQTT, in order of arrival
+        if enable_metrics:
+            metrics.gauge('command-queue', control.pending())
+        for source, command in control.commands():
+            handle_command(source, command, current_time)
+
+        # Archive the frames, before anything is drawn on them, if recording is active.
+        # They are copied here and encoded on the session's writer thread.
+        # A paused video still gets its first frame, every sample has to refer to one
+        if is_recording and session and (video_playing or session.frame_count == 0):
+            elapsed_time = current_time - recording_start_time
+            session.write_frames([trackers[camera].frame for camera in range(camera_count)], elapsed_time)
+            if enable_metrics:
+                metrics.lap('archive')
 
         # Record data if recording is active
-        if is_recording and csv_writer and current_time - last_recorded_time >= 0.1:
+        if is_recording and session and current_time - last_recorded_time >= 0.1:
             elapsed_time = current_time - recording_start_time
-            csv_writer.writerow([elapsed_time, frame.shape[1], frame.shape[0], fixed_point[0], fixed_point[1], pos_x, pos_y, diameter, angle_x, angle_y])
+            # Width and Height belong to the first camera like the other leading columns
+            row = [elapsed_time, trackers[0].frame.shape[1], trackers[0].frame.shape[0]]
+            for camera in range(camera_count):
+                base = trackers[camera].fixed_point
+                r = results[camera]
+                row += [base[0], base[1], r.pos_x, r.pos_y, r.diameter, r.angle_x, r.angle_y]
+            if camera_count > 1:
+                row.append(skew)
+            session.write_sample(row)
             last_recorded_time = current_time
 
-        if is_recording and csv_writer:
+        if is_recording and session:
             # Draw recording indicator
             cv2.circle(frame, (500, 20), 10, (0, 0, 255), -1)
             cv2.putText(frame, f"{elapsed_time:.2f}s", (520, 25), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 255), 2)
 
         # draw circle
-        circle_pos = (int(pos_x_avg), int(pos_y_avg))
+        circle_pos = (int(round(result.pos_x)), int(round(result.pos_y)))
         cv2.line(frame, fixed_point, circle_pos, (0, 255, 0), 2)
-        cv2.circle(frame, circle_pos, int(diameter_avg/2), (0, 255, 255), 2)
+        cv2.circle(frame, circle_pos, int(result.diameter/2), (0, 255, 255), 2)
         cv2.circle(frame, circle_pos, 5, (0, 0, 255), -1)
 
         # Display the X, Y coordinates and the diameter
-        cv2.putText(frame, f"Angle X: {angle_x:.2f} degrees", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
-        cv2.putText(frame, f"Diameter: {diameter:.2f} degrees", (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
-        cv2.putText(frame, f"Angle Y: {angle_y:.2f} degrees", (10, 90), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+        cv2.putText(frame, f"Angle X: {result.angle_x:.2f} degrees", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+        cv2.putText(frame, f"Diameter: {result.diameter:.2f} degrees", (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+        cv2.putText(frame, f"Angle Y: {result.angle_y:.2f} degrees", (10, 90), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+
+        if camera_count > 1:
+            cv2.putText(frame, f"Camera {active_camera}", (10, 120), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
 
         # Draw exclusion zone if points are available
         if exclusion_points:
             draw_exclusion_zone(frame, exclusion_points)
 
+        # Draw the metrics overlay and publish the periodic report
+        if enable_metrics:
+            if show_metrics:
+                metrics.draw_overlay(frame)
+            if metrics.report_due():
+                summary = metrics.summary()
+                print(metrics.format_line(summary))
+                if enable_mqtt:
+                    control.publish("metrics", metrics.to_json(summary))
+
         # show the frame to our screen
         cv2.imshow("Frame", frame)
         if show_mask:
-            cv2.imshow("Mask", mask)
+            cv2.imshow("Mask", tracker.mask)
         cv2.imshow("Shortcuts", shortcuts_image)
+        if enable_metrics:
+            metrics.lap('display')
 
         # if the 'q' key is pressed, stop the loop
         if key == ord("q"):
-            if is_recording and csv_file:
-                # Close the CSV file if recording
+            if is_recording and session:
+                # Close the session if recording
                 stop_recording()
             break
 
-    # if we are not using a video file, stop the camera video stream
+    # if we are not using a video file, stop the camera threads
     if video_path is not None:
         vs.release()
     else:
-        vs.stream.release()
+        cameras.stop()
+    if pool is not None:
+        pool.shutdown()
+    for frame_bus in frame_buses:
+        if frame_bus is not None:
+            frame_bus.close()
 
     # close all windows
     cv2.destroyAllWindows()
 
     # Disconnect MQTT client before closing
-    if enable_mqtt:
-        mqtt_client.loop_stop()
-        mqtt_client.disconnect()
+    control.stop()
 
     print('Closing program!')
     sys.exit(0)
@@ -0,0 +1,173 @@
+#!/usr/bin/python
+
+import sys
+import argparse
+import csv
+import time
+import cv2
+import numpy as np
+
+from utils import *
+from tracker import Tracker
+from session import SessionReader
+
+# Deterministic replay of a video file or an archived session through the tracking pipeline.
+# Frames are processed back to back (no waitKey pacing, no warm-up sleep) and
+# the per-frame angle stream is either written as a golden file or compared
+# against one.
+
+COLUMNS = ['Frame', 'Time', 'Detected', 'Pos X', 'Pos Y', 'Diameter', 'Angle_X', 'Angle_Y']
+
+
+# ===========================================================================//
+# -----------------------------------------------------------// Argument Parser
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Replay a video through the tracking pipeline and compare against a golden output.')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('-v', '--video', help='Path to the video file.')
+    source.add_argument('-s', '--session', help='Name of a recorded session to re-track.')
+    parser.add_argument('--sessions-directory', help='Directory holding the sessions (default: sessions-directory from the config).', default=None)
+    parser.add_argument('--start', help='Start of the session range in seconds (default: the first frame).', type=float, default=None)
+    parser.add_argument('--end', help='End of the session range in seconds.', type=float, default=None)
+    parser.add_argument('-g', '--golden', help='Path to the golden CSV file.', required=True)
+    parser.add_argument('-w', '--write-golden', help='Write the golden file instead of comparing.', action='store_true')
+    parser.add_argument('-c', '--config', help='Path to the config file.', default='config.yaml')
+    parser.add_argument('-i', '--config-internal', help='Path to the internal config file.', default='config_internal.yaml')
+    parser.add_argument('--angle-tolerance', help='Allowed angle difference in degrees.', type=float, default=0.5)
+    parser.add_argument('--pixel-tolerance', help='Allowed position and diameter difference in pixels.', type=float, default=1.0)
+    args = parser.parse_args()
+    if args.video is not None and (args.start is not None or args.end is not None):
+        parser.error('--start and --end only apply to sessions (-s)')
+    return args
+
+
+# ===========================================================================//
+# --------------------------------------------------------------------// Replay
+
+# -----------------------------------------/
+# ---/ Iterate (time, frame) over a video file
+def video_frames(video_path):
+    vs = cv2.VideoCapture(video_path)
+    if not vs.isOpened():
+        raise IOError(f"Could not open video file {video_path}")
+    while True:
+        ret, frame = vs.read()
+        if not ret:
+            break
+        yield vs.get(cv2.CAP_PROP_POS_MSEC) / 1000, frame
+    vs.release()
+
+# -----------------------------------------/
+# ---/ Run the frames through the pipeline, returns the rows and frame timings
+def replay_frames(frames, config, config_internal):
+    tracker = Tracker.from_config(config, config_internal)
+
+    rows = []
+    timings = []
+    frame_index = 0
+    for frame_time, frame in frames:
+        start = time.perf_counter()
+        result = tracker.process(frame, frame_time)
+        timings.append(time.perf_counter() - start)
+
+        # Like the recorder, the tracker holds the last detection when the ball is lost
+        rows.append([frame_index, frame_time, int(result.detected),
+                     result.pos_x, result.pos_y, result.diameter, result.angle_x, result.angle_y])
+        frame_index += 1
+
+    return rows, timings
+
+# -----------------------------------------/
+# ---/ Write rows to a golden file
+def write_golden(file_path, rows):
+    with open(file_path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(COLUMNS)
+        writer.writerows(rows)
+
+# -----------------------------------------/
+# ---/ Read a golden file as an array
+def read_golden(file_path):
+    return np.loadtxt(file_path, delimiter=',', skiprows=1, ndmin=2)
+
+# -----------------------------------------/
+# ---/ Compare replayed rows against the golden rows
+def compare(rows, golden, angle_tolerance, pixel_tolerance):
+    actual = np.array(rows, dtype=np.float64).reshape(-1, len(COLUMNS))
+    report = {
+        'frames': len(actual),
+        'golden-frames': len(golden),
+        'passed': len(actual) == len(golden),
+    }
+    n = min(len(actual), len(golden))
+    actual = actual[:n]
+    golden = golden[:n]
+
+    detected = COLUMNS.index('Detected')
+    report['detection-mismatches'] = int(np.count_nonzero(actual[:, detected] != golden[:, detected]))
+
+    failing = np.zeros(n, dtype=bool)
+    for name in ['Pos X', 'Pos Y', 'Diameter', 'Angle_X', 'Angle_Y']:
+        column = COLUMNS.index(name)
+        error = np.abs(actual[:, column] - golden[:, column])
+        tolerance = angle_tolerance if name.startswith('Angle') else pixel_tolerance
+        failing |= error > tolerance
+        report[f'{name} max error'] = float(error.max()) if n else 0.0
+        report[f'{name} mean error'] = float(error.mean()) if n else 0.0
+
+    report['frames-out-of-tolerance'] = int(np.count_nonzero(failing))
+    report['passed'] = report['passed'] and report['detection-mismatches'] == 0 and not failing.any()
+    return report
+
+# -----------------------------------------/
+# ---/ Throughput from the per-frame timings
+def throughput(timings):
+    if not timings:
+        return {'fps': 0.0, 'p50 ms': 0.0, 'p95 ms': 0.0, 'p99 ms': 0.0}
+    timings = np.array(timings)
+    p50, p95, p99 = np.percentile(timings, [50, 95, 99]) * 1000
+    return {'fps': len(timings) / timings.sum(), 'p50 ms': p50, 'p95 ms': p95, 'p99 ms': p99}
+
+
+# ===========================================================================//
+# --------------------------------------------------------// Main program logic
+
+if __name__ == '__main__':
+
+    args = parse_arguments()
+    config = read_config(args.config)
+    config_internal = read_config(args.config_internal)
+
+    if args.session is not None:
+        # Archived frames are already resized, and are tracked with the session's own calibration
+        sessions_directory = args.sessions_directory or config.get('sessions-directory', 'sessions')
+        session = SessionReader(sessions_directory, args.session)
+        config_internal['fixed-point'] = session.meta['fixed-points'][0]
+        config_internal['exclusion-zone'] = [v for point in session.meta['exclusion-zones'][0] for v in point]
+        rows, timings = replay_frames(session.frames(args.start, args.end), config, config_internal)
+        session.close()
+    else:
+        rows, timings = replay_frames(video_frames(args.video), config, config_internal)
+    speed = throughput(timings)
+
+    print(f"Processed {len(rows)} frames")
+    print(f"Throughput: {speed['fps']:.1f} fps (per frame p50 {speed['p50 ms']:.2f} ms, p95 {speed['p95 ms']:.2f} ms, p99 {speed['p99 ms']:.2f} ms)")
+
+    if args.write_golden:
+        write_golden(args.golden, rows)
+        print(f"Golden output written to {args.golden}")
+        sys.exit(0)
+
+    report = compare(rows, read_golden(args.golden), args.angle_tolerance, args.pixel_tolerance)
+    for key, value in report.items():
+        if isinstance(value, float):
+            print(f"{key}: {value:.4f}")
+        else:
+            print(f"{key}: {value}")
+
+    if report['passed']:
+        print('Replay matches golden output')
+        sys.exit(0)
+    print('Replay differs from golden output')
+    sys.exit(1)
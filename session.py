@@ -0,0 +1,264 @@
+import os
+import csv
+import warnings
+import datetime
+import queue
+from threading import Thread
+import yaml
+import numpy as np
+import cv2
+
+from utils import *
+
+# ===========================================================================//
+# ------------------------------------------------------------// Session Archive
+
+# A recording session is a directory holding everything captured between
+# pressing record and stop:
+#
+#   meta.yaml    name, start time, source, calibration, frame count, duration
+#   video.avi    resized frames of the first camera (video-N.avi for camera N)
+#   index.csv    Frame, Time: the time of every video frame since the start
+#   angles.csv   the tracked samples, same columns as the old angles_N.csv
+#                files plus the video frame they were taken from
+#
+# The video is Motion JPEG, every frame is a key frame, so any frame can be
+# decoded directly after a seek without decoding from the start. Encoding and
+# writing the video happens on a writer thread, the frame loop only copies
+# the frames into a bounded queue.
+
+VIDEO_CODEC = 'MJPG'
+INDEX_COLUMNS = ['Frame', 'Time']
+
+# -----------------------------------------/
+# ---/ Session name from the current time
+def default_session_name():
+    return datetime.datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
+
+# -----------------------------------------/
+# ---/ List the sessions in a directory, oldest first
+def list_sessions(directory):
+    if not os.path.isdir(directory):
+        return []
+    names = [name for name in os.listdir(directory) if os.path.exists(os.path.join(directory, name, 'meta.yaml'))]
+    return sorted(names)
+
+# -----------------------------------------/
+# ---/ Video file name for a camera
+def video_filename(camera=0):
+    return camera_config_key('video', camera) + '.avi'
+
+
+# -----------------------------------------/
+# ---/ Writing side, used while recording
+class SessionWriter:
+
+    def __init__(self, directory, name, header, meta=None, fps=30, queue_size=30):
+        # Never overwrite an existing session, add a suffix instead
+        path = os.path.join(directory, name)
+        suffix = 1
+        while os.path.exists(path):
+            path = os.path.join(directory, f"{name}-{suffix}")
+            suffix += 1
+        os.makedirs(path)
+
+        self.path = path
+        self.name = os.path.basename(path)
+        self.fps = fps
+        self.meta = dict(meta or {})
+        self.meta['name'] = self.name
+        self.meta['created'] = datetime.datetime.now().isoformat(timespec='seconds')
+
+        self.videos = []
+        self.frame_count = 0
+        self.duration = 0
+
+        self.index_file = open(os.path.join(path, 'index.csv'), 'w', newline='')
+        self.index_writer = csv.writer(self.index_file)
+        self.index_writer.writerow(INDEX_COLUMNS)
+
+        self.angles_file = open(os.path.join(path, 'angles.csv'), 'w', newline='')
+        self.angles_writer = csv.writer(self.angles_file)
+        self.angles_writer.writerow(header + ['Frame'])
+
+        self.write_meta()
+
+        # (frame number, elapsed, frames) for the writer thread, None stops it.
+        # A full queue blocks the caller rather than losing frames
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.error = None
+        self.thread = Thread(target=self.write_loop, daemon=True)
+        self.thread.start()
+
+    # -----------------------------------------/
+    # ---/ Queue one frame per camera, elapsed is the time since the start in seconds
+    # The frames are copied, so the caller can draw on them afterwards
+    def write_frames(self, frames, elapsed):
+        if self.error is not None:
+            raise self.error
+        self.queue.put((self.frame_count, elapsed, [frame.copy() for frame in frames]))
+        self.frame_count += 1
+        self.duration = elapsed
+
+    # -----------------------------------------/
+    # ---/ Writer thread, encodes the queued frames in order
+    def write_loop(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            if self.error is not None:
+                continue  # keep draining so the frame loop never blocks on a dead writer
+            frame_number, elapsed, frames = item
+            try:
+                # The video writers are opened on the first frame, once the size is known
+                if not self.videos:
+                    fourcc = cv2.VideoWriter_fourcc(*VIDEO_CODEC)
+                    for camera, frame in enumerate(frames):
+                        size = (frame.shape[1], frame.shape[0])
+                        self.videos.append(cv2.VideoWriter(os.path.join(self.path, video_filename(camera)), fourcc, self.fps, size))
+                for video, frame in zip(self.videos, frames):
+                    video.write(frame)
+                self.index_writer.writerow([frame_number, elapsed])
+            except Exception as e:
+                self.error = e
+
+    # -----------------------------------------/
+    # ---/ Write a tracked sample, it refers to the last written frame
+    def write_sample(self, row):
+        if self.frame_count == 0:
+            raise ValueError(f"Session {self.name} has no frame yet, write_frames must come before write_sample")
+        self.angles_writer.writerow(list(row) + [self.frame_count - 1])
+
+    # -----------------------------------------/
+    # ---/ Write the metadata file
+    def write_meta(self):
+        self.meta['frames'] = self.frame_count
+        self.meta['duration'] = self.duration
+        with open(os.path.join(self.path, 'meta.yaml'), 'w') as file:
+            yaml.dump(self.meta, file)
+
+    # -----------------------------------------/
+    # ---/ Wait for the queued frames and close all files
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        for video in self.videos:
+            video.release()
+        self.index_file.close()
+        self.angles_file.close()
+        self.write_meta()
+        if self.error is not None:
+            raise self.error
+
+
+# -----------------------------------------/
+# ---/ Reading side, random access by time or frame
+class SessionReader:
+
+    def __init__(self, directory, name):
+        self.path = os.path.join(directory, name)
+        self.name = name
+        self.meta = read_config(os.path.join(self.path, 'meta.yaml'))
+
+        with warnings.catch_warnings():
+            # An empty session only has the headers
+            warnings.simplefilter('ignore', UserWarning)
+            index = np.loadtxt(os.path.join(self.path, 'index.csv'), delimiter=',', skiprows=1, ndmin=2)
+            self.samples = np.loadtxt(os.path.join(self.path, 'angles.csv'), delimiter=',', skiprows=1, ndmin=2)
+        self.frame_times = index[:, 1] if len(index) else np.zeros(0)
+
+        with open(os.path.join(self.path, 'angles.csv'), 'r') as file:
+            self.columns = next(csv.reader(file))
+        self.sample_times = self.samples[:, 0] if len(self.samples) else np.zeros(0)
+
+        self.videos = {}
+
+    @property
+    def duration(self):
+        return float(self.frame_times[-1]) if len(self.frame_times) else 0.0
+
+    # -----------------------------------------/
+    # ---/ Frame shown at a time, the last frame written at or before it
+    # Returns None if the session has no frames
+    def frame_at(self, t):
+        if len(self.frame_times) == 0:
+            return None
+        frame = int(np.searchsorted(self.frame_times, t, side='right')) - 1
+        return min(max(frame, 0), len(self.frame_times) - 1)
+
+    # -----------------------------------------/
+    # ---/ Open (once) the video of a camera
+    def video(self, camera=0):
+        if camera not in self.videos:
+            self.videos[camera] = cv2.VideoCapture(os.path.join(self.path, video_filename(camera)))
+        return self.videos[camera]
+
+    # -----------------------------------------/
+    # ---/ Decode a single frame by number
+    def read_frame(self, frame, camera=0):
+        video = self.video(camera)
+        video.set(cv2.CAP_PROP_POS_FRAMES, frame)
+        ret, image = video.read()
+        return image if ret else None
+
+    # -----------------------------------------/
+    # ---/ Decode the frame shown at a time
+    def frame_at_time(self, t, camera=0):
+        frame = self.frame_at(t)
+        if frame is None:
+            return None
+        return self.read_frame(frame, camera)
+
+    # -----------------------------------------/
+    # ---/ Iterate (time, frame) over a time range, seeking once to its start
+    # A start of None begins at the first frame, an end of None runs to the last
+    def frames(self, start=None, end=None, camera=0):
+        first = 0 if start is None else int(np.searchsorted(self.frame_times, start, side='left'))
+        last = len(self.frame_times) if end is None else int(np.searchsorted(self.frame_times, end, side='right'))
+        if first >= last:
+            return
+        video = self.video(camera)
+        video.set(cv2.CAP_PROP_POS_FRAMES, first)
+        for frame in range(first, last):
+            ret, image = video.read()
+            if not ret:
+                return
+            yield float(self.frame_times[frame]), image
+
+    # -----------------------------------------/
+    # ---/ Tracked samples in a time range
+    def samples_between(self, start=None, end=None):
+        first = 0 if start is None else int(np.searchsorted(self.sample_times, start, side='left'))
+        last = len(self.sample_times) if end is None else int(np.searchsorted(self.sample_times, end, side='right'))
+        return self.samples[first:last]
+
+    # -----------------------------------------/
+    # ---/ Copy a time range into a new session, times restart at zero
+    def extract(self, start, end, directory, name):
+        if start is None:
+            start = float(self.frame_times[0]) if len(self.frame_times) else 0.0
+        meta = dict(self.meta)
+        meta['extracted-from'] = {'session': self.name, 'start': start, 'end': end}
+        cameras = meta.get('cameras', 1)
+        writer = SessionWriter(directory, name, self.columns[:-1], meta, fps=meta.get('fps', 30))
+
+        first_frame = int(np.searchsorted(self.frame_times, start, side='left'))
+        streams = [self.frames(start, end, camera) for camera in range(cameras)]
+        for images in zip(*streams):
+            t = images[0][0]
+            writer.write_frames([image for _, image in images], t - start)
+
+        for sample in self.samples_between(start, end):
+            row = list(sample[:-1])
+            row[0] -= start
+            writer.angles_writer.writerow(row + [max(int(sample[-1]) - first_frame, 0)])
+        writer.close()
+        return writer.name
+
+    # -----------------------------------------/
+    # ---/ Release the videos
+    def close(self):
+        for video in self.videos.values():
+            video.release()
+        self.videos = {}
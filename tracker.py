@@ -0,0 +1,202 @@
+import time
+import cv2
+import imutils
+import numpy as np
+
+from utils import *
+from filters import create_filter
+
+# ===========================================================================//
+# ----------------------------------------------------------// Tracking Pipeline
+
+# The per-frame tracking shared by the recorder, the replay harness and any
+# other front end. Nothing in here touches the UI, the camera or module
+# globals. All intermediate images live in work buffers owned by the tracker
+# and are written through OpenCV's dst= outputs, so steady-state processing
+# does not allocate new frames.
+
+# -----------------------------------------/
+# ---/ Result of a single processed frame
+# The raw_* values are the sub-pixel measurement of the current detection,
+# pos_x, pos_y and diameter are the filtered estimate the angles are
+# calculated from.
+class TrackingResult:
+    __slots__ = ('detected',
+                 'raw_pos_x', 'raw_pos_y', 'raw_diameter',
+                 'pos_x', 'pos_y', 'diameter', 'angle_x', 'angle_y')
+
+    def __init__(self):
+        self.detected = False
+        self.raw_pos_x = 0
+        self.raw_pos_y = 0
+        self.raw_diameter = 0
+        self.pos_x = 0
+        self.pos_y = 0
+        self.diameter = 0
+        self.angle_x = 0
+        self.angle_y = 0
+
+
+class Tracker:
+
+    # -----------------------------------------/
+    # ---/ Init
+    def __init__(self, frame_width, lower_hsv, upper_hsv, fixed_point, exclusion_points,
+                 diameter_bounds, angle_bounds, moving_average_strength, filter_config=None, metrics=None):
+        self.frame_width = frame_width
+        self.lower_hsv = np.array(lower_hsv)
+        self.upper_hsv = np.array(upper_hsv)
+        self.fixed_point = tuple(fixed_point)
+        self.exclusion_points = list(exclusion_points)
+        self.metrics = metrics
+
+        # One filter per axis, falling back to the moving average when not configured
+        filter_config = filter_config or {}
+        self.pos_x_filter = create_filter(filter_config.get('pos-x'), moving_average_strength)
+        self.pos_y_filter = create_filter(filter_config.get('pos-y'), moving_average_strength)
+        self.diameter_filter = create_filter(filter_config.get('diameter'), moving_average_strength)
+
+        # Calculate the linear and log parameters
+        input_range = np.array(diameter_bounds)
+        output_range = np.array(angle_bounds)
+        self.linear_params = calculate_linear_params(input_range, output_range)
+        self.log_params = calculate_log_params(input_range, output_range)
+
+        # The last detection is held when the ball is lost. The result object
+        # is reused, its values are only valid until the next call to process()
+        self.result = TrackingResult()
+
+        # Work buffers, allocated on the first frame and whenever the input size changes
+        self.input_shape = None
+        self.frame = None
+        self.blurred = None
+        self.hsv = None
+        self.mask = None
+        self.scratch = None
+        self.keep_mask = None  # inverted exclusion mask, None if there is no exclusion zone
+
+    # -----------------------------------------/
+    # ---/ Create a tracker from the config files
+    # Additional cameras use their own calibration keys ('fixed-point-1', ...)
+    # and fall back to the first camera's calibration until it has been set.
+    @classmethod
+    def from_config(cls, config, config_internal, camera=0, metrics=None):
+        fixed_point = config_internal.get(camera_config_key('fixed-point', camera), config_internal['fixed-point'])
+        points_list = config_internal.get(camera_config_key('exclusion-zone', camera), config_internal['exclusion-zone'])
+        exclusion_points = [(points_list[i], points_list[i+1]) for i in range(0, len(points_list), 2)]
+        return cls(config['frame-width'],
+                   config['HSV-values']['lower-hsv'],
+                   config['HSV-values']['upper-hsv'],
+                   fixed_point,
+                   exclusion_points,
+                   config['diameter-bounds'],
+                   config['angle-bounds'],
+                   config['moving-average-strength'],
+                   filter_config=config.get('filter'),
+                   metrics=metrics)
+
+    # -----------------------------------------/
+    # ---/ Update the calibration
+    def set_fixed_point(self, point):
+        self.fixed_point = tuple(point)
+
+    def set_exclusion_points(self, points):
+        self.exclusion_points = list(points)
+        self.update_keep_mask()
+
+    # -----------------------------------------/
+    # ---/ (Re)allocate the work buffers for a new input size
+    def allocate(self, shape):
+        self.input_shape = shape
+        height = int(shape[0] * self.frame_width / float(shape[1]))
+        self.frame = np.empty((height, self.frame_width, 3), dtype=np.uint8)
+        self.blurred = np.empty_like(self.frame)
+        self.hsv = np.empty_like(self.frame)
+        self.mask = np.empty((height, self.frame_width), dtype=np.uint8)
+        self.scratch = np.empty_like(self.mask)
+        self.update_keep_mask()
+
+    # -----------------------------------------/
+    # ---/ Rebuild the cached inverted exclusion mask
+    def update_keep_mask(self):
+        if self.mask is None:
+            return
+        if not self.exclusion_points:
+            self.keep_mask = None
+            return
+        exclusion_mask = create_exclusion_mask(self.mask, self.exclusion_points)
+        self.keep_mask = cv2.bitwise_not(exclusion_mask)
+
+    # -----------------------------------------/
+    # ---/ Resize a raw frame into the frame buffer
+    def resize(self, frame):
+        if frame.shape != self.input_shape:
+            self.allocate(frame.shape)
+        cv2.resize(frame, (self.frame.shape[1], self.frame.shape[0]), dst=self.frame, interpolation=cv2.INTER_AREA)
+        return self.frame
+
+    # -----------------------------------------/
+    # ---/ Process a raw frame, timestamp in seconds (defaults to now)
+    def process(self, frame, timestamp=None):
+        if timestamp is None:
+            timestamp = time.perf_counter()
+        frame = self.resize(frame)
+
+        # blur the frame and convert it to the HSV color space
+        cv2.GaussianBlur(frame, (11, 11), 0, dst=self.blurred)
+        cv2.cvtColor(self.blurred, cv2.COLOR_BGR2HSV, dst=self.hsv)
+
+        # construct a mask for the color "green", then perform
+        # a series of dilations and erosions to remove any small
+        # blobs left in the mask
+        cv2.inRange(self.hsv, self.lower_hsv, self.upper_hsv, dst=self.mask)
+        cv2.erode(self.mask, None, dst=self.scratch, iterations=2)
+        cv2.dilate(self.scratch, None, dst=self.mask, iterations=2)
+
+        # Apply the exclusion mask
+        if self.keep_mask is not None:
+            cv2.bitwise_and(self.mask, self.keep_mask, dst=self.mask)
+
+        if self.metrics is not None:
+            self.metrics.lap('mask')
+
+        # find contours in the mask and initialize the current sub-pixel
+        # (x, y) center of the ball. findContours leaves its input untouched
+        cnts = cv2.findContours(self.mask, cv2.RETR_EXTERNAL,
+            cv2.CHAIN_APPROX_SIMPLE)
+        cnts = imutils.grab_contours(cnts)
+        center = None
+
+        # only proceed if at least one contour was found
+        if len(cnts) > 0:
+            # find the largest contour in the mask, then use
+            # it to compute the minimum enclosing circle and
+            # centroid
+            c = max(cnts, key=cv2.contourArea)
+            ((x, y), radius) = cv2.minEnclosingCircle(c)
+            M = cv2.moments(c)
+            if M["m00"] > 0:
+                center = (M["m10"] / M["m00"], M["m01"] / M["m00"])
+
+        if self.metrics is not None:
+            self.metrics.lap('detect')
+            self.metrics.mark_detection()
+
+        result = self.result
+        result.detected = center is not None
+        if center is not None:
+            result.raw_pos_x = center[0]
+            result.raw_pos_y = center[1]
+            result.raw_diameter = radius * 2
+
+            # Filter the measurement
+            result.pos_x = self.pos_x_filter.update(result.raw_pos_x, timestamp)
+            result.pos_y = self.pos_y_filter.update(result.raw_pos_y, timestamp)
+            result.diameter = self.diameter_filter.update(result.raw_diameter, timestamp)
+
+            # Calculate the angles from the filtered estimate
+            result.angle_x = calculate_angle(self.fixed_point, (result.pos_x, result.pos_y))
+            # result.angle_y = linear_interpolation(result.diameter, self.linear_params)
+            result.angle_y = logarithmic_interpolation(result.diameter, self.log_params)
+
+        return result
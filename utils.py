@@ -14,14 +14,21 @@ def read_config(file_path):
         config = yaml.safe_load(file)
     return config
 
+# -----------------------------------------/
+# ---/ Config key for a camera, the first camera uses the plain key
+def camera_config_key(key, camera=0):
+    if camera == 0:
+        return key
+    return f"{key}-{camera}"
+
 # -----------------------------------------/
 # ---/ Save fixed point to config file
-def save_fixed_point_to_config(file_path, point):
+def save_fixed_point_to_config(file_path, point, camera=0):
     with open(file_path, 'r') as file:
         config = yaml.safe_load(file)
     
     # Update the config with new fixed point
-    config['fixed-point'] = list(point)
+    config[camera_config_key('fixed-point', camera)] = list(point)
 
     # Write the updated config back to the file
     with open(file_path, 'w') as file:
@@ -29,7 +36,7 @@ def save_fixed_point_to_config(file_path, point):
 
 # -----------------------------------------/
 # ---/ Save exclusion points to config file
-def save_exclusion_points_to_config(file_path, points):
+def save_exclusion_points_to_config(file_path, points, camera=0):
     with open(file_path, 'r') as file:
         config = yaml.safe_load(file)
     
@@ -37,7 +44,7 @@ def save_exclusion_points_to_config(file_path, points):
     points_flat = [item for sublist in points for item in sublist]
 
     # Update the config with new exclusion points
-    config['exclusion-zone'] = points_flat
+    config[camera_config_key('exclusion-zone', camera)] = points_flat
 
     # Write the updated config back to the file
     with open(file_path, 'w') as file:
@@ -45,16 +52,6 @@ def save_exclusion_points_to_config(file_path, points):
 
 
 
-# ===========================================================================//
-# -----------------------------------------------------------------// Recording
-
-# -----------------------------------------/
-# ---/ Get unique filename
-def get_unique_filename(base_name, count):
-    return f"{base_name}_{count}.csv"
-
-
-
 # ===========================================================================//
 # ----------------------------------------------------------------// Main Logic
 
@@ -98,7 +95,7 @@ def calculate_angle(p1, p2):
 # ---/ Create shortcuts image
 def create_shortcuts_image():
     # Create a blank image
-    image = np.zeros((300, 600, 3), dtype=np.uint8)
+    image = np.zeros((330, 600, 3), dtype=np.uint8)
     font = cv2.FONT_HERSHEY_SIMPLEX
 
     # Define your shortcuts and their descriptions
@@ -111,7 +108,8 @@ def create_shortcuts_image():
         "Right mouse click": "Move a point",
         "del or backspace": "Delete a point",
         "p": "Set Base Position",
-        "r": "Start/Stop Recording"
+        "r": "Start/Stop Recording",
+        "c": "Switch Camera (only with multiple cameras)"
     }
 
     # Starting Y position